@@ -4,29 +4,88 @@ Main module holding the actual functionality of Border-Patrol
 """
 import atexit
 import builtins
-import inspect
+import importlib
 import logging
 import os.path
 import sys
+import sysconfig
 from builtins import __import__ as builtin_import
+from importlib import import_module as builtin_import_module
+from itertools import chain
 from operator import itemgetter
 
-from pkg_resources import DistributionNotFound, get_distribution, working_set
-
 UNKNOWN = "unknown"
 BUILTINS = list(sys.builtin_module_names) + ["__future__"]
-
-try:
-    __version__ = get_distribution("border-patrol").version
-except DistributionNotFound:
-    __version__ = UNKNOWN
+ENV_VAR = "BORDER_PATROL"
+STD_LIB_PATHS = tuple(
+    os.path.join(sysconfig.get_paths()[key], "") for key in ("stdlib", "platstdlib")
+)
+SITE_PATHS = tuple(
+    os.path.join(sysconfig.get_paths()[key], "") for key in ("purelib", "platlib")
+)
 
 __file__ = os.path.join(
-    os.getcwd(), os.path.dirname(inspect.getfile(inspect.currentframe()))
+    os.getcwd(), os.path.dirname(sys._getframe().f_code.co_filename)
 )
 
 logger = logging.getLogger(__name__)
 
+REPORTS = {
+    "print_stdout": print,
+    "print_stderr": lambda x: print(x, file=sys.stderr),
+    "log_error": logger.error,
+    "log_warning": logger.warning,
+    "log_info": logger.info,
+    "log_debug": logger.debug,
+}
+
+
+def get_pkg_resources():
+    """Imports ``pkg_resources`` lazily without tracking its imports
+
+    Importing ``pkg_resources`` is slow, so it is deferred until versions
+    are actually needed, usually at exit.
+
+    Returns:
+        module: ``pkg_resources`` module
+    """
+    pkg_resources = sys.modules.get("pkg_resources")
+    if pkg_resources is None:
+        tracker, builtins.__import__ = builtins.__import__, builtin_import
+        try:
+            pkg_resources = builtin_import_module("pkg_resources")
+        finally:
+            builtins.__import__ = tracker
+    return pkg_resources
+
+
+def get_version():
+    """Retrieves version of Border-Patrol itself
+
+    Returns:
+        str: version string of Border-Patrol
+    """
+    try:
+        return get_pkg_resources().get_distribution("border-patrol").version
+    # Never fail and it's more than just DistributionNotFound
+    except Exception:
+        return UNKNOWN
+
+
+if sys.version_info >= (3, 7):
+
+    def __getattr__(name):
+        """Retrieves ``__version__`` lazily to keep importing Border-Patrol fast"""
+        if name == "__version__":
+            global __version__
+            __version__ = get_version()
+            return __version__
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+else:
+    __version__ = get_version()
+
 
 class IdentityDict(dict):
     """Dictionary returning key by default"""
@@ -42,17 +101,42 @@ def get_pkg_to_dist_map():
         dict: mapping of packages to distributions
     """
     mapping = IdentityDict()
-    for dist in working_set:
+    for dist in get_pkg_resources().working_set:
         try:
-            pkgs = dist.get_metadata("top_level.txt")
+            pkgs = dist.get_metadata("top_level.txt").split()
         except Exception:
-            pass
-        else:
-            for pkg in pkgs.split():
-                mapping[pkg] = dist.project_name
+            # e.g. wheels built by meson-python have no top_level.txt
+            try:
+                pkgs = record_top_levels(dist.get_metadata_lines("RECORD"))
+            except Exception:
+                continue
+        for pkg in pkgs:
+            mapping[pkg] = dist.project_name
     return mapping
 
 
+def record_top_levels(lines):
+    """Extracts names of top-level packages from a ``RECORD`` file
+
+    Args:
+        lines (iterable): lines of the ``RECORD`` file
+
+    Returns:
+        set: names of top-level packages and modules
+    """
+    top_levels = set()
+    for line in lines:
+        top = line.split(",", 1)[0].split("/", 1)[0]
+        if top.endswith(".py"):
+            top_levels.add(top[:-3])
+        elif top.endswith((".so", ".pyd")):
+            # strip ABI suffix of extension modules like .cpython-311-*.so
+            top_levels.add(top.split(".", 1)[0])
+        elif top and "." not in top and top != "__pycache__":
+            top_levels.add(top)
+    return top_levels
+
+
 def get_package(module):
     """Gets package part of module
 
@@ -65,6 +149,23 @@ def get_package(module):
     return module.__name__.split(".")[0]
 
 
+def get_importer_package(globals):
+    """Gets the package a relative import is resolved against
+
+    Args:
+        globals (dict): globals of the importing module
+
+    Returns:
+        str: name of the importing module's package
+    """
+    package = globals.get("__package__")
+    if package is None:
+        package = globals["__name__"]
+        if "__path__" not in globals:
+            package = package.rpartition(".")[0]
+    return package
+
+
 def package_version(package, pkg_to_dist_map=None):
     """Retrieves version string of package
 
@@ -84,7 +185,7 @@ def package_version(package, pkg_to_dist_map=None):
     if version == UNKNOWN:
         try:
             dist_name = pkg_to_dist_map[package.__name__]
-            version = get_distribution(dist_name).version
+            version = get_pkg_resources().get_distribution(dist_name).version
         # Never fail and it's more than just DistributionNotFound
         except Exception:
             pass
@@ -105,6 +206,194 @@ def package_path(package):
     return path
 
 
+def is_std_lib(package):
+    """Checks if package is part of Python's stdlib judging by its location
+
+    Args:
+        package: module instance of package
+
+    Returns:
+        bool: True if package is a builtin or located in the stdlib
+    """
+    path = getattr(package, "__file__", None)
+    if path is None:
+        # namespace packages have a __path__ but no __file__
+        return not hasattr(package, "__path__")
+    return path.startswith(STD_LIB_PATHS) and not path.startswith(SITE_PATHS)
+
+
+def dist_info_top_levels(dist_info):
+    """Retrieves names of top-level packages of a distribution
+
+    Args:
+        dist_info (str): path of a ``.dist-info`` or ``.egg-info`` directory
+
+    Returns:
+        set: names of the distribution's top-level packages
+    """
+    try:
+        with open(os.path.join(dist_info, "top_level.txt")) as fh:
+            return set(fh.read().split())
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(dist_info, "RECORD")) as fh:
+            return record_top_levels(fh)
+    except OSError:
+        return set()
+
+
+def normalize_dist_name(name):
+    """Normalizes a distribution or package name for comparison
+
+    Args:
+        name (str): name, e.g. ``Foo.Bar`` or ``foo-1.0.dist-info``
+
+    Returns:
+        str: lower case name without version and with ``_`` as separator
+    """
+    return name.split("-", 1)[0].lower().replace(".", "_")
+
+
+def dist_info_index(entry, cache):
+    """Indexes ``.dist-info`` and ``.egg-info`` entries of a directory
+
+    The index is cached and only rebuilt if the modification time of the
+    directory changed, e.g. since a distribution was installed or upgraded.
+
+    Args:
+        entry (str): directory, usually an entry of ``sys.path``
+        cache (dict): cache of indices
+
+    Returns:
+        dict: normalized distribution names mapped to lists of entries
+    """
+    try:
+        mtime = os.stat(entry).st_mtime_ns
+    except OSError:
+        return {}
+    if entry in cache and cache[entry][0] == mtime:
+        return cache[entry][1]
+    index = {}
+    for dir_name in sorted(os.listdir(entry)):
+        if dir_name.endswith((".dist-info", ".egg-info")):
+            index.setdefault(normalize_dist_name(dir_name), []).append(dir_name)
+    cache[entry] = (mtime, index)
+    return index
+
+
+def package_metadata_path(package, cache=None):
+    """Retrieves path of the metadata file of package's distribution
+
+    The distribution is looked up next to the package, i.e. in the
+    ``sys.path`` entry it was actually imported from, so that a distribution
+    changed on disk before the first import is still found.
+
+    Args:
+        package (module): package as module instance
+        cache (dict):
+            cache of directory indices and top-level packages of
+            distributions. Avoids re-reading metadata if passed. (optional)
+
+    Returns:
+        str: path of ``METADATA`` or ``PKG-INFO`` file
+    """
+    if cache is None:
+        cache = {}
+
+    path = getattr(package, "__file__", None)
+    if path is None:
+        return UNKNOWN
+    entry = os.path.dirname(path)
+    if hasattr(package, "__path__"):
+        entry = os.path.dirname(entry)
+    index = dist_info_index(entry, cache)
+
+    name = package.__name__
+    normalized = normalize_dist_name(name)
+    # the distribution is usually named like the package, try this first
+    candidates = chain(
+        index.get(normalized, ()),
+        (
+            dir_name
+            for dist_name, dir_names in index.items()
+            if dist_name != normalized
+            for dir_name in dir_names
+        ),
+    )
+    for dir_name in candidates:
+        dist_info = os.path.join(entry, dir_name)
+        if os.path.isfile(dist_info):
+            # egg-info might also be a single file instead of a directory
+            if normalize_dist_name(dir_name) == normalized:
+                return dist_info
+            continue
+        if dist_info not in cache:
+            cache[dist_info] = dist_info_top_levels(dist_info)
+        if name in cache[dist_info]:
+            for file_name in ("METADATA", "PKG-INFO"):
+                metadata = os.path.join(dist_info, file_name)
+                if os.path.isfile(metadata):
+                    return metadata
+    return UNKNOWN
+
+
+def metadata_version(path):
+    """Reads the version from the header of a metadata file
+
+    Args:
+        path (str): path of ``METADATA`` or ``PKG-INFO`` file
+
+    Returns:
+        str: version string or ``unknown``
+    """
+    try:
+        with open(path) as fh:
+            for line in fh:
+                if not line.strip():
+                    break
+                if line.startswith("Version:"):
+                    return line.split(":", 1)[1].strip()
+    except (OSError, ValueError):
+        pass
+    return UNKNOWN
+
+
+def metadata_stat(path):
+    """Cheap fingerprint of a metadata file to detect changes on disk
+
+    Args:
+        path (str): path of metadata file
+
+    Returns:
+        tuple: inode, size and modification time or None if not available
+    """
+    if path == UNKNOWN:
+        return None
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+def activate(report="print_stderr"):
+    """Activates Border-Patrol with one of the predefined reporting functions
+
+    Args:
+        report (str): one of :obj:`REPORTS`, e.g. ``log_info`` has the same
+            effect as ``from border_patrol import with_log_info``
+
+    Returns:
+        BorderPatrol: Border-Patrol instance
+    """
+    if report not in REPORTS:
+        raise ValueError(
+            "Unknown report {}, use one of {}".format(report, ", ".join(REPORTS))
+        )
+    return BorderPatrol(report_fun=REPORTS[report]).register()
+
+
 class BorderPatrol(object):
     """Border-Patrol singleton class to track imports of packages.
 
@@ -119,6 +408,9 @@ class BorderPatrol(object):
 
     Attributes:
         template (str): string template for the report
+        snapshots (dict): package name mapped to its ``__version__``,
+            metadata path and metadata stat at the time the package was
+            first imported
     """
 
     # defines this class as singleton
@@ -150,13 +442,47 @@ class BorderPatrol(object):
         self.registered = getattr(self, "registered", False)
         self.packages = getattr(self, "packages", [builtin_import(__name__)])
         self.template = getattr(self, "template", "{pkg}   {ver}   {path}")
+        self.snapshots = getattr(self, "snapshots", {})
+        self.dist_info_cache = getattr(self, "dist_info_cache", {})
+        self.resolved = getattr(self, "resolved", {})
 
-    def __call__(self, *args, **kwargs):
+    def __call__(self, name, globals=None, locals=None, fromlist=(), level=0):
         """Wraps the builtin import to track libraries"""
-        module = builtin_import(*args, **kwargs)
-        self.track(module)
+        module = builtin_import(name, globals, locals, fromlist, level)
+        importer = get_importer_package(globals) if level > 0 else None
+        if (importer, name, level) not in self.resolved:
+            self.resolve(importer, name, level)
+        return module
+
+    def import_module(self, name, package=None):
+        """Wraps :func:`importlib.import_module` to track libraries"""
+        module = builtin_import_module(name, package)
+        level = len(name) - len(name.lstrip("."))
+        importer = package if level > 0 else None
+        if (importer, name, level) not in self.resolved:
+            self.resolve(importer, name, level)
         return module
 
+    def resolve(self, importer, name, level):
+        """Resolves and tracks the top-level package of a successful import
+
+        The result is cached per importer package, name and level, so that
+        repeated imports only cost a dictionary lookup.
+
+        Args:
+            importer (str): package a relative import is resolved against
+            name (str): name of the imported module
+            level (int): number of leading dots of a relative import
+
+        Returns:
+            str: name of the top-level package
+        """
+        top = (importer if level > 0 else name).partition(".")[0]
+        self.resolved[(importer, name, level)] = top
+        if top not in BUILTINS:
+            self.track_package(sys.modules.get(top))
+        return top
+
     def track(self, module):
         """Tracks packages for later reporting
 
@@ -165,9 +491,78 @@ class BorderPatrol(object):
         """
         if module.__name__ in BUILTINS:
             return
-        package = builtin_import(get_package(module))
-        if package not in self.packages:
+        self.track_package(sys.modules.get(get_package(module)))
+
+    def track_package(self, package):
+        """Tracks a top-level package for later reporting
+
+        Modules registered under a different name than their ``__name__``,
+        e.g. ``_decimal`` as ``decimal``, are normalized to the package of
+        their ``__name__`` and tracked only once.
+
+        Args:
+            package: module instance of package, ``None`` is ignored
+        """
+        if package is None:
+            return
+        name = get_package(package)
+        if name in BUILTINS or any(pkg.__name__ == name for pkg in self.packages):
+            return
+        package = sys.modules.get(name)
+        if package is not None:
             self.packages.append(package)
+            self.snapshot(package)
+
+    def snapshot(self, package):
+        """Records version and metadata stat of a package at import time
+
+        The snapshot is usually taken while the package's ``__init__`` is
+        still running, i.e. before ``__version__`` is set, so the version is
+        read from the header of the located metadata file instead.
+        Packages of the stdlib cannot drift and are skipped.
+
+        Args:
+            package: module instance of package
+        """
+        if self.ignore_std_lib and is_std_lib(package):
+            return
+        path = package_metadata_path(package, self.dist_info_cache)
+        version = getattr(package, "__version__", UNKNOWN)
+        if not isinstance(version, str):
+            version = UNKNOWN
+        if version == UNKNOWN and path != UNKNOWN:
+            version = metadata_version(path)
+        self.snapshots[package.__name__] = (version, path, metadata_stat(path))
+
+    def check_drift(self):
+        """Checks which packages changed on disk after they were imported
+
+        Only the metadata files are stat'ed, no metadata is re-read, so
+        this is cheap enough to be called periodically. Packages without
+        metadata, see :meth:`unresolved`, cannot be checked.
+
+        Returns:
+            list: list of drifted package's (name, version at import,
+            metadata path)
+        """
+        return [
+            (name, version, path)
+            for name, (version, path, stat) in sorted(self.snapshots.items())
+            if path != UNKNOWN and metadata_stat(path) != stat
+        ]
+
+    def unresolved(self):
+        """Lists packages whose metadata could not be found at import time
+
+        These are e.g. namespace packages, editable installs or local
+        modules, for which drift cannot be detected.
+
+        Returns:
+            list: sorted names of packages
+        """
+        return sorted(
+            name for name, (_, path, _) in self.snapshots.items() if path == UNKNOWN
+        )
 
     def register(self):
         """Registers/activates Border Patrol
@@ -177,6 +572,7 @@ class BorderPatrol(object):
         """
         if not self.registered:
             builtins.__import__ = self
+            importlib.import_module = self.import_module
             atexit.register(self.at_exit)
             self.registered = True
         return self
@@ -189,6 +585,7 @@ class BorderPatrol(object):
         """
         if self.registered:
             builtins.__import__ = builtin_import
+            importlib.import_module = builtin_import_module
             atexit.unregister(self.at_exit)
             self.registered = False
         return self
@@ -206,17 +603,55 @@ class BorderPatrol(object):
                 package
                 for package in packages
                 if package.__name__ in pkg_to_dist_map.keys()
+                or self.snapshots.get(package.__name__, (None, UNKNOWN))[1]
+                != UNKNOWN
             ]
 
         return [
             (
                 package.__name__,
-                package_version(package, pkg_to_dist_map),
+                self.version(package, pkg_to_dist_map),
                 package_path(package),
             )
             for package in packages
         ]
 
+    def version(self, package, pkg_to_dist_map=None):
+        """Retrieves version string of package as it was imported
+
+        For tracked packages, the version recorded at import time is used
+        and no metadata is re-read since it might have changed on disk.
+
+        Args:
+            package (module): package as module instance
+            pkg_to_dist_map (dict):
+                mapping of packages to their distributions.
+                Avoids recalculation if passed. (optional)
+
+        Returns:
+            str: version string of package
+        """
+        if package.__name__ not in self.snapshots:
+            return package_version(package, pkg_to_dist_map)
+        version = self.snapshots[package.__name__][0]
+        if version == UNKNOWN:
+            version = getattr(package, "__version__", UNKNOWN)
+        return version if isinstance(version, str) else UNKNOWN
+
+    def as_dict(self):
+        """Reports currently imported libraries in structured form
+
+        Returns:
+            dict: Python version and list of package's name, version, path
+        """
+        return {
+            "python": sys.version,
+            "packages": [
+                {"name": name, "version": version, "path": path}
+                for name, version, path in sorted(self.report(), key=itemgetter(0))
+            ],
+        }
+
     def at_exit(self):
         """Handler to be called at exit"""
         self.report_fun(str(self))
@@ -227,10 +662,10 @@ class BorderPatrol(object):
             msg += ["Python version is {}".format(sys.version)]
         msg += ["Following packages were imported:"]
         report = self.report()
-        names, versions, paths = zip(*report)
-        name_just = max(len(name) for name in names)
-        version_just = max(len(version) for version in versions)
-        path_just = max(len(path) for path in paths)
+        names, versions, paths = zip(*report) if report else ((), (), ())
+        name_just = max((len(name) for name in names), default=0)
+        version_just = max((len(version) for version in versions), default=0)
+        path_just = max((len(path) for path in paths), default=0)
         msg.append(
             self.template.format(
                 pkg="PACKAGE".ljust(name_just),
@@ -246,4 +681,11 @@ class BorderPatrol(object):
                     path=path.ljust(path_just),
                 )
             )
+        drifted = self.check_drift()
+        if drifted:
+            msg += ["Following packages changed on disk after import:"]
+            msg += [
+                self.template.format(pkg=name, ver=version, path=path)
+                for name, version, path in drifted
+            ]
         return "\n".join(msg)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a script or module with Border-Patrol activated, similar to ``coverage run``::
+
+    python -m border_patrol [-r REPORT] [-f FORMAT] script.py [args ...]
+    python -m border_patrol [-r REPORT] [-f FORMAT] -m module [args ...]
+
+Alternatively, ``python -m border_patrol --install-pth`` installs a
+``border_patrol.pth`` file into site-packages which activates Border-Patrol at
+interpreter startup whenever the environment variable ``BORDER_PATROL`` is set.
+As long as it is unset, only ``os.environ`` is checked and nothing is imported.
+"""
+import argparse
+import os.path
+import runpy
+import sys
+import sysconfig
+
+from . import ENV_VAR, REPORTS, BorderPatrol, activate
+
+OPTIONS_WITH_VALUE = ("-r", "--report", "-f", "--format")
+PTH_FILE = "border_patrol.pth"
+PTH_LINE = (
+    "import os; os.environ.get({!r}) and __import__('border_patrol.auto')\n"
+).format(ENV_VAR)
+
+
+def install_pth(site_dir=None):
+    """Installs the ``.pth`` file for auto-activation via ``BORDER_PATROL``
+
+    Args:
+        site_dir (str): target directory, default is the site-packages
+            directory of the current interpreter
+
+    Returns:
+        str: path of the ``.pth`` file
+    """
+    if site_dir is None:
+        site_dir = sysconfig.get_paths()["purelib"]
+    path = os.path.join(site_dir, PTH_FILE)
+    with open(path, "w") as fh:
+        fh.write(PTH_LINE)
+    return path
+
+
+def uninstall_pth(site_dir=None):
+    """Removes the ``.pth`` file for auto-activation if present
+
+    Args:
+        site_dir (str): target directory, default is the site-packages
+            directory of the current interpreter
+
+    Returns:
+        str: path of the ``.pth`` file
+    """
+    if site_dir is None:
+        site_dir = sysconfig.get_paths()["purelib"]
+    path = os.path.join(site_dir, PTH_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+    return path
+
+
+def parse_args(args):
+    """Parses command line parameters
+
+    Args:
+        args ([str]): command line parameters as list of strings
+
+    Returns:
+        :obj:`argparse.Namespace`: command line parameters namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m border_patrol",
+        description="Run a Python script or module and report all imported packages",
+    )
+    parser.add_argument(
+        "-r",
+        "--report",
+        choices=sorted(REPORTS),
+        default="print_stderr",
+        help="reporting function, default: %(default)s",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="template",
+        help="template of a report line with fields {pkg}, {ver} and {path}",
+    )
+    parser.add_argument(
+        "-m",
+        "--module",
+        action="store_true",
+        help="run target as module like python -m does",
+    )
+    parser.add_argument(
+        "--install-pth",
+        action="store_true",
+        help="install {} to activate via the {} environment variable".format(
+            PTH_FILE, ENV_VAR
+        ),
+    )
+    parser.add_argument(
+        "--uninstall-pth", action="store_true", help="remove {}".format(PTH_FILE)
+    )
+    parser.add_argument("target", nargs="?", help="script or module to run")
+    parser.add_argument(
+        "args", nargs="*", default=[], help="arguments passed to the target"
+    )
+    # everything after the target is passed unchanged, including ``--``
+    idx = 0
+    while idx < len(args):
+        if args[idx] == "--":
+            idx += 1
+            break
+        if args[idx] in OPTIONS_WITH_VALUE:
+            idx += 2
+        elif args[idx].startswith("-"):
+            idx += 1
+        else:
+            break
+    parsed = parser.parse_args(args[: idx + 1])
+    parsed.args = args[idx + 1 :]
+    if parsed.target is None and not (parsed.install_pth or parsed.uninstall_pth):
+        parser.error("a script or module to run is required")
+    return parsed
+
+
+def main(args):
+    """Main entry point allowing external calls
+
+    Args:
+        args ([str]): command line parameter list
+    """
+    args = parse_args(args)
+    if args.install_pth:
+        print("Installed {}".format(install_pth()))
+    if args.uninstall_pth:
+        print("Removed {}".format(uninstall_pth()))
+    if args.target is None:
+        return
+
+    activate(args.report)
+    if args.template is not None:
+        BorderPatrol().template = args.template
+
+    sys.argv = [args.target] + args.args
+    if args.module:
+        runpy.run_module(args.target, run_name="__main__", alter_sys=True)
+    else:
+        sys.path[0] = os.path.dirname(os.path.abspath(args.target))
+        runpy.run_path(args.target, run_name="__main__")
+
+
+def run():
+    """Entry point for console_scripts"""
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Imported by the ``border_patrol.pth`` file at interpreter startup to activate
+Border-Patrol if the environment variable ``BORDER_PATROL`` is set.
+
+Its value selects the report, e.g. ``BORDER_PATROL=log_info``, any other
+value like ``BORDER_PATROL=1`` falls back to printing on stderr.
+"""
+import os
+
+from . import ENV_VAR, REPORTS, activate
+
+report = os.environ.get(ENV_VAR)
+if report:
+    activate(report if report in REPORTS else "print_stderr")
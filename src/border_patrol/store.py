@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""
+Companion module to collect Border-Patrol reports of many hosts and runs in a
+local SQLite database and query them, e.g. ``which hosts ran numpy 1.15 in
+job X?``::
+
+    python -m border_patrol.store reports.db ingest --run X node*.log
+    python -m border_patrol.store reports.db query numpy --version 1.15.1
+    python -m border_patrol.store reports.db diff X Y
+
+Reports are accepted in text form, i.e. the output of ``str(BorderPatrol())``
+with the default template, or in structured form, i.e. the JSON serialization
+of :meth:`border_patrol.BorderPatrol.as_dict`. Identical environments are
+stored only once, identified by a hash of their content.
+"""
+import argparse
+import hashlib
+import json
+import os.path
+import sqlite3
+import sys
+import time
+
+from . import UNKNOWN
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    python TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS packages (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, package)
+);
+CREATE INDEX IF NOT EXISTS packages_version ON packages (package, version);
+CREATE TABLE IF NOT EXISTS runs (
+    host TEXT NOT NULL,
+    run TEXT NOT NULL,
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    ingested REAL NOT NULL,
+    PRIMARY KEY (run, host)
+);
+CREATE INDEX IF NOT EXISTS runs_host ON runs (host);
+CREATE INDEX IF NOT EXISTS runs_snapshot ON runs (snapshot_id);
+"""
+
+PYTHON_PREFIX = "Python version is "
+PACKAGES_HEADER = "Following packages were imported:"
+EMPTY_HEADER = "PACKAGE   VERSION   PATH"
+
+
+def parse_table(lines, header):
+    """Parses the package rows of a report in text form
+
+    The column widths are taken from the first row and validated against
+    the header line ``PACKAGE   VERSION   PATH``. Parsing stops at the first
+    line not fitting these columns, e.g. the next line of a log file.
+
+    Args:
+        lines (list): lines following the header line
+        header (str): header line of the package table
+
+    Returns:
+        list: list of package's (name, version, path)
+    """
+    sep = " " * 3
+    header = header.rstrip()
+    if not lines or not header.startswith("PACKAGE") or "PATH" not in header:
+        return []
+    fields = lines[0].split()
+    if len(fields) < 3:
+        return []
+    # layout of the first row: name, version and path column start
+    ver_col = lines[0].index(fields[1], len(fields[0]))
+    path_col = lines[0].index(fields[2], ver_col + len(fields[1]))
+    name_just, version_just = ver_col - len(sep), path_col - ver_col - len(sep)
+    # header columns are at least as wide as the words in the header
+    if header != "{}{}{}{}PATH".format(
+        "PACKAGE".ljust(name_just), sep, "VERSION".ljust(version_just), sep
+    ):
+        return []
+
+    packages = []
+    for line in lines:
+        name = line[:name_just].rstrip()
+        version = line[ver_col : ver_col + version_just].rstrip()
+        path = line[path_col:].rstrip()
+        if not (
+            name
+            and version
+            and path
+            and len(line[:ver_col].split()) == 1
+            and len(line[ver_col:path_col].split()) == 1
+            and line[ver_col - len(sep) : ver_col] == sep
+            and line[path_col - len(sep) : path_col] == sep
+            and not path.startswith(" ")
+        ):
+            break
+        packages.append((name, version, path))
+    return packages
+
+
+def parse_reports(report):
+    """Parses all reports contained in a text, e.g. a log file
+
+    Since reports often end up in log files, anything in front of the first
+    line of a report, e.g. a logging prefix, as well as lines before and
+    after reports are ignored. Only the default template is supported.
+
+    Args:
+        report (str): text containing the output of ``str(BorderPatrol())``
+
+    Returns:
+        list: list of tuples of Python version and list of package's
+        (name, version, path)
+
+    Raises:
+        ValueError: if the package rows of a report cannot be parsed
+    """
+    lines = report.splitlines()
+    reports = []
+    idx = 0
+    while idx < len(lines):
+        line = lines[idx]
+        idx += 1
+        if PYTHON_PREFIX in line:
+            # sys.version might span several lines
+            python = [line.split(PYTHON_PREFIX, 1)[1]]
+            while idx < len(lines) and len(python) < 4:
+                if lines[idx].endswith(PACKAGES_HEADER):
+                    break
+                python.append(lines[idx])
+                idx += 1
+            else:
+                continue
+            idx += 1
+        elif PACKAGES_HEADER in line:
+            python = []
+        else:
+            continue
+        header = lines[idx] if idx < len(lines) else ""
+        packages = parse_table(lines[idx + 1 :], header)
+        # only a report without any packages has no rows
+        if not packages and header.rstrip() != EMPTY_HEADER:
+            raise ValueError(
+                "No packages found in report with header {!r}, only the "
+                "default template is supported".format(header)
+            )
+        idx += 1 + len(packages)
+        reports.append(("\n".join(python) or UNKNOWN, packages))
+    return reports
+
+
+def parse_report(report):
+    """Parses a single report in text form
+
+    Args:
+        report (str): text containing the output of ``str(BorderPatrol())``
+
+    Returns:
+        tuple: Python version and list of package's (name, version, path)
+
+    Raises:
+        ValueError: if the text contains no or more than one report
+    """
+    reports = parse_reports(report)
+    if len(reports) != 1:
+        raise ValueError(
+            "Expected one Border-Patrol report but found {}".format(len(reports))
+        )
+    return reports[0]
+
+
+def parse_dict(report):
+    """Parses a report in structured form
+
+    Args:
+        report (dict): report as generated by ``BorderPatrol().as_dict()``
+
+    Returns:
+        tuple: Python version and list of package's (name, version, path)
+
+    Raises:
+        ValueError: if the report is malformed
+    """
+    try:
+        packages = [
+            (pkg["name"], pkg.get("version", UNKNOWN), pkg.get("path", UNKNOWN))
+            for pkg in report["packages"]
+        ]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError("Malformed Border-Patrol report: {!r}".format(e))
+    return report.get("python", UNKNOWN), packages
+
+
+def snapshot_hash(python, packages):
+    """Content hash of an environment snapshot
+
+    Args:
+        python (str): Python version
+        packages (list): list of package's (name, version, path)
+
+    Returns:
+        str: hex digest identifying the snapshot
+    """
+    content = json.dumps([python, sorted(map(list, packages))])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ReportStore(object):
+    """Local SQLite store of Border-Patrol reports
+
+    Args:
+        path (str): path of the SQLite database, created if not existing
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """Closes the database connection"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def ingest(self, report, host, run):
+        """Adds a report of a host within a run
+
+        A report of the same host and run that was ingested before is
+        replaced. Texts with several reports are rejected since it is
+        ambiguous which one belongs to the run, use :func:`parse_reports`
+        to split them.
+
+        Args:
+            report (str or dict): report in text or structured form
+            host (str): name of the host the report was generated on
+            run (str): name of the run, e.g. the job id
+
+        Returns:
+            int: id of the environment snapshot
+        """
+        if isinstance(report, dict):
+            python, packages = parse_dict(report)
+        else:
+            python, packages = parse_report(report)
+        digest = snapshot_hash(python, packages)
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT id FROM snapshots WHERE hash = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                snapshot_id = self.conn.execute(
+                    "INSERT INTO snapshots (hash, python) VALUES (?, ?)",
+                    (digest, python),
+                ).lastrowid
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?)",
+                    [(snapshot_id,) + tuple(pkg) for pkg in packages],
+                )
+            else:
+                snapshot_id = row[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)",
+                (host, run, snapshot_id, time.time()),
+            )
+        return snapshot_id
+
+    def query(self, package, version=None, run=None, host=None):
+        """Finds which hosts and runs used a package
+
+        Args:
+            package (str): name of the package
+            version (str): only this version of the package (optional)
+            run (str): only this run (optional)
+            host (str): only this host (optional)
+
+        Returns:
+            list: list of (run, host, version) sorted by run and host
+        """
+        sql = (
+            "SELECT r.run, r.host, p.version FROM packages p "
+            "JOIN runs r ON r.snapshot_id = p.snapshot_id WHERE p.package = ?"
+        )
+        params = [package]
+        for column, value in (("p.version", version), ("r.run", run), ("r.host", host)):
+            if value is not None:
+                sql += " AND {} = ?".format(column)
+                params.append(value)
+        sql += " ORDER BY r.run, r.host"
+        return self.conn.execute(sql, params).fetchall()
+
+    def versions(self, run):
+        """Retrieves all versions of all packages used in a run
+
+        Args:
+            run (str): name of the run
+
+        Returns:
+            dict: package name mapped to the set of its versions
+        """
+        rows = self.conn.execute(
+            "SELECT DISTINCT p.package, p.version FROM packages p "
+            "JOIN runs r ON r.snapshot_id = p.snapshot_id WHERE r.run = ?",
+            (run,),
+        )
+        versions = {}
+        for package, version in rows:
+            versions.setdefault(package, set()).add(version)
+        return versions
+
+    def diff(self, run_a, run_b):
+        """Compares the package versions used in two runs
+
+        Args:
+            run_a (str): name of the first run
+            run_b (str): name of the second run
+
+        Returns:
+            list: list of (package, versions in run_a, versions in run_b)
+            for all packages whose versions differ, sorted by package
+        """
+        versions_a = self.versions(run_a)
+        versions_b = self.versions(run_b)
+        return [
+            (
+                package,
+                sorted(versions_a.get(package, ())),
+                sorted(versions_b.get(package, ())),
+            )
+            for package in sorted(set(versions_a) | set(versions_b))
+            if versions_a.get(package) != versions_b.get(package)
+        ]
+
+
+def read_report(path):
+    """Reads a report in text or JSON form from a file or stdin
+
+    Args:
+        path (str): path of the file or ``-`` for stdin
+
+    Returns:
+        str or dict: report in text or structured form
+    """
+    if path == "-":
+        content = sys.stdin.read()
+    else:
+        with open(path) as fh:
+            content = fh.read()
+    if content.lstrip().startswith("{"):
+        return json.loads(content)
+    return content
+
+
+def parse_args(args):
+    """Parses command line parameters
+
+    Args:
+        args ([str]): command line parameters as list of strings
+
+    Returns:
+        :obj:`argparse.Namespace`: command line parameters namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m border_patrol.store",
+        description="Store and query Border-Patrol reports of many hosts and runs",
+    )
+    parser.add_argument("db", help="path of the SQLite database")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    ingest = commands.add_parser("ingest", help="add reports to the database")
+    ingest.add_argument("--run", required=True, help="name of the run")
+    ingest.add_argument(
+        "--host", help="name of the host, default: file name without extension"
+    )
+    ingest.add_argument(
+        "files", nargs="+", metavar="FILE", help="report files, - for stdin"
+    )
+
+    query = commands.add_parser("query", help="find hosts and runs using a package")
+    query.add_argument("package", help="name of the package")
+    query.add_argument("--version", help="only this version")
+    query.add_argument("--run", help="only this run")
+    query.add_argument("--host", help="only this host")
+
+    diff = commands.add_parser("diff", help="compare package versions of two runs")
+    diff.add_argument("run_a", help="name of the first run")
+    diff.add_argument("run_b", help="name of the second run")
+    return parser.parse_args(args)
+
+
+def main(args):
+    """Main entry point allowing external calls
+
+    Args:
+        args ([str]): command line parameter list
+    """
+    args = parse_args(args)
+    with ReportStore(args.db) as store:
+        if args.command == "ingest":
+            failed = []
+            for path in args.files:
+                host = args.host
+                if host is None:
+                    host = os.path.splitext(os.path.basename(path))[0]
+                try:
+                    store.ingest(read_report(path), host=host, run=args.run)
+                except (OSError, ValueError) as e:
+                    print("{}: {}".format(path, e), file=sys.stderr)
+                    failed.append(path)
+            if failed:
+                raise SystemExit(1)
+        elif args.command == "query":
+            for row in store.query(args.package, args.version, args.run, args.host):
+                print("   ".join(row))
+        elif args.command == "diff":
+            for package, versions_a, versions_b in store.diff(args.run_a, args.run_b):
+                print(
+                    "{}   {}   {}".format(
+                        package,
+                        ", ".join(versions_a) or "-",
+                        ", ".join(versions_b) or "-",
+                    )
+                )
+
+
+def run():
+    """Entry point for console_scripts"""
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
@@ -1,13 +1,36 @@
 from border_patrol import with_print_stdout
 
 import builtins
+import importlib
 import logging
+import os
 import re
+import subprocess
+import sys
+import timeit
 
 import numpy as np
+import pytest
 import sklearn
 
-from border_patrol import BorderPatrol
+import border_patrol
+from border_patrol import (
+    UNKNOWN,
+    BorderPatrol,
+    activate,
+    builtin_import,
+    metadata_stat,
+    record_top_levels,
+)
+from border_patrol.__main__ import (
+    PTH_LINE,
+    install_pth,
+    main,
+    parse_args,
+    uninstall_pth,
+)
+from border_patrol.store import EMPTY_HEADER, ReportStore, parse_report, parse_reports
+from border_patrol.store import main as store_main
 
 
 def test_capture_import(bpatrol):
@@ -73,14 +96,16 @@ def test_singleton_constructor(bpatrol):
 
 
 def test_register(bpatrol):
-    from border_patrol import builtin_import
+    from border_patrol import builtin_import, builtin_import_module
 
     assert bpatrol.registered
     bpatrol.unregister()
     assert builtins.__import__ is builtin_import
+    assert importlib.import_module is builtin_import_module
     bpatrol.unregister()
     bpatrol.register()
     assert builtins.__import__ is bpatrol
+    assert importlib.import_module == bpatrol.import_module
 
 
 def test_report_py(caplog):
@@ -93,3 +118,374 @@ def test_report_py(caplog):
     with caplog.at_level(logging.INFO):
         bpatrol.at_exit()
     assert re.search("Python version is", caplog.text)
+
+
+def test_record_top_levels():
+    record = [
+        "numpy/__init__.py,sha256=abc,123",
+        "numpy-2.4.6.dist-info/METADATA,,",
+        "numpy.libs/libopenblas.so,,",
+        "__pycache__/six.cpython-311.pyc,,",
+        "six.py,,",
+        "_cffi_backend.cpython-311-x86_64-linux-gnu.so,,",
+        "../../bin/f2py,,",
+    ]
+    assert record_top_levels(record) == {"numpy", "six", "_cffi_backend"}
+
+
+def test_snapshot(bpatrol):
+    version, path, stat = bpatrol.snapshots["numpy"]
+    assert version == np.__version__
+    assert os.path.basename(path) in ("METADATA", "PKG-INFO")
+    assert stat is not None
+    assert "numpy" not in [name for name, _, _ in bpatrol.check_drift()]
+
+
+def test_check_drift(bpatrol, tmpdir):
+    metadata = tmpdir.join("METADATA")
+    metadata.write("Version: 1.0")
+    path = str(metadata)
+    bpatrol.snapshots["drifty"] = ("1.0", path, metadata_stat(path))
+    assert ("drifty", "1.0", path) not in bpatrol.check_drift()
+    metadata.write("Version: 1.0.1")
+    assert ("drifty", "1.0", path) in bpatrol.check_drift()
+    assert re.search("changed on disk after import:(\n.*)*\ndrifty   1.0", str(bpatrol))
+    metadata.remove()
+    assert ("drifty", "1.0", path) in bpatrol.check_drift()
+    del bpatrol.snapshots["drifty"]
+
+
+def test_upgrade_before_first_import(bpatrol, tmpdir, monkeypatch):
+    tmpdir.mkdir("lateepkg").join("__init__.py").write("")
+    dist_info = tmpdir.mkdir("lateepkg-1.0.dist-info")
+    dist_info.join("METADATA").write("Name: lateepkg\nVersion: 1.0\n")
+    dist_info.join("top_level.txt").write("lateepkg\n")
+    monkeypatch.syspath_prepend(str(tmpdir))
+    # upgrade on disk after the process started but before the first import
+    dist_info.move(tmpdir.join("lateepkg-2.0.dist-info"))
+    metadata = tmpdir.join("lateepkg-2.0.dist-info", "METADATA")
+    metadata.write("Name: lateepkg\nVersion: 2.0\n")
+    try:
+        bpatrol("lateepkg", {}, None, None, 0)
+        package = sys.modules["lateepkg"]
+        assert bpatrol.snapshots["lateepkg"][1] == str(metadata)
+        assert ("lateepkg", "2.0", package.__file__) in bpatrol.report()
+        assert "lateepkg" not in [name for name, _, _ in bpatrol.check_drift()]
+        metadata.write("Name: lateepkg\nVersion: 2.1\n")
+        assert ("lateepkg", "2.0", str(metadata)) in bpatrol.check_drift()
+    finally:
+        bpatrol.packages.remove(sys.modules.pop("lateepkg"))
+        del bpatrol.snapshots["lateepkg"]
+
+
+def test_upgrade_after_import(bpatrol, tmpdir, monkeypatch):
+    tmpdir.mkdir("pkgb").join("__init__.py").write("")
+    dist_info = tmpdir.mkdir("pkgb-1.0.dist-info")
+    dist_info.join("METADATA").write("Name: pkgb\nVersion: 1.0\n")
+    dist_info.join("top_level.txt").write("pkgb\n")
+    monkeypatch.syspath_prepend(str(tmpdir))
+    try:
+        bpatrol("pkgb", {}, None, None, 0)
+        package = sys.modules["pkgb"]
+        assert bpatrol.snapshots["pkgb"][0] == "1.0"
+        # upgrade on disk while version 1.0 is still loaded
+        dist_info.remove()
+        dist_info = tmpdir.mkdir("pkgb-2.0.dist-info")
+        dist_info.join("METADATA").write("Name: pkgb\nVersion: 2.0\n")
+        dist_info.join("top_level.txt").write("pkgb\n")
+        assert ("pkgb", "1.0", package.__file__) in bpatrol.report()
+        assert "pkgb" in [name for name, _, _ in bpatrol.check_drift()]
+        assert re.search("pkgb +1.0", str(bpatrol))
+    finally:
+        bpatrol.packages.remove(sys.modules.pop("pkgb"))
+        del bpatrol.snapshots["pkgb"]
+
+
+def test_activate(bpatrol):
+    assert activate("print_stdout") is bpatrol
+    assert bpatrol.report_fun is print
+    with pytest.raises(ValueError):
+        activate("print_nowhere")
+
+
+def test_main_script(bpatrol, tmpdir, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", list(sys.argv))
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    monkeypatch.setattr(bpatrol, "template", bpatrol.template)
+    script = tmpdir.join("script.py")
+    script.write("import sys\nprint(sys.argv)\n")
+    main(["-r", "print_stdout", "-f", "{pkg}:{ver}", str(script), "-x", "1"])
+    assert capsys.readouterr().out.strip() == str([str(script), "-x", "1"])
+    assert bpatrol.report_fun is print
+    assert bpatrol.template == "{pkg}:{ver}"
+    assert sys.path[0] == str(tmpdir)
+
+
+def test_parse_args():
+    args = parse_args(["-r", "log_info", "s.py", "--", "-m", "x", "--format"])
+    assert (args.report, args.target) == ("log_info", "s.py")
+    assert args.args == ["--", "-m", "x", "--format"]
+    args = parse_args(["-m", "--", "pkg.mod", "-r", "x"])
+    assert (args.module, args.target, args.args) == (True, "pkg.mod", ["-r", "x"])
+
+
+def test_main_module(bpatrol, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", list(sys.argv))
+    with pytest.raises(SystemExit):
+        main(["-m", "json.tool", "--help"])
+    assert "json.tool" in capsys.readouterr().out
+
+
+def test_main_no_target(capsys):
+    with pytest.raises(SystemExit):
+        main([])
+    assert "required" in capsys.readouterr().err
+
+
+def test_activation_is_lazy():
+    code = "import sys, border_patrol.auto; print('pkg_resources' in sys.modules)"
+    env = dict(
+        os.environ,
+        BORDER_PATROL="print_stdout",
+        PYTHONPATH=os.path.dirname(border_patrol.__file__),
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+    lines = output.decode().splitlines()
+    assert lines[0] == "False"
+    assert "Following packages were imported:" in lines
+
+
+def test_install_pth(tmpdir):
+    path = install_pth(str(tmpdir))
+    with open(path) as fh:
+        assert fh.read() == PTH_LINE
+    assert "BORDER_PATROL" in PTH_LINE
+    assert uninstall_pth(str(tmpdir)) == path
+    assert not os.path.exists(path)
+
+
+def test_parse_report(bpatrol):
+    python, packages = parse_report("INFO:border_patrol:" + str(bpatrol))
+    assert python == sys.version
+    assert packages == sorted(bpatrol.report())
+
+
+def test_parse_log(bpatrol):
+    bpatrol.report_py = True
+    report = str(bpatrol)
+    log = "\n".join(
+        [
+            "INFO:root:job started",
+            "INFO:border_patrol:" + report,
+            "INFO:root:job finished in 3s",
+            "ERROR:root:oops  something   went wrong",
+            "",
+        ]
+    )
+    assert parse_reports(log) == [(sys.version, sorted(bpatrol.report()))]
+    assert parse_report(log) == parse_reports(log)[0]
+    # short names lead to a header wider than the rows
+    log = (
+        "Following packages were imported:\n"
+        "PACKAGE   VERSION   PATH\n"
+        "np      1.0     /np\n"
+        "scipy   1.0.1   /scipy\n"
+        "INFO:root:job finished in 3s\n"
+    )
+    assert parse_reports(log) == [
+        (UNKNOWN, [("np", "1.0", "/np"), ("scipy", "1.0.1", "/scipy")])
+    ]
+    with pytest.raises(ValueError):
+        parse_report(log + log)
+    with pytest.raises(ValueError):
+        parse_report("INFO:root:job finished in 3s")
+    # custom templates are not supported
+    with pytest.raises(ValueError):
+        parse_report("Following packages were imported:\nnumpy:1.15.1\n")
+    assert parse_report("Following packages were imported:\n" + EMPTY_HEADER) == (
+        UNKNOWN,
+        [],
+    )
+
+
+def test_store(bpatrol, tmpdir):
+    report = bpatrol.as_dict()
+    report["packages"] = [{"name": "numpy", "version": "1.15.1", "path": "/np"}]
+    with ReportStore(str(tmpdir.join("reports.db"))) as store:
+        snapshot = store.ingest(report, host="node1", run="X")
+        assert store.ingest(report, host="node2", run="X") == snapshot
+        report["packages"][0]["version"] = "1.16.0"
+        assert store.ingest(report, host="node1", run="Y") != snapshot
+        assert store.ingest(str(bpatrol), host="node3", run="Z") != snapshot
+        assert store.query("numpy", version="1.15.1") == [
+            ("X", "node1", "1.15.1"),
+            ("X", "node2", "1.15.1"),
+        ]
+        assert store.query("numpy", run="Y") == [("Y", "node1", "1.16.0")]
+        assert ("numpy", ["1.15.1"], ["1.16.0"]) in store.diff("X", "Y")
+
+
+def test_store_main(bpatrol, tmpdir, capsys):
+    db = str(tmpdir.join("reports.db"))
+    for host, version in (("node1", "1.15.1"), ("node2", "1.16.0")):
+        report = tmpdir.join(host + ".log")
+        report.write(
+            "Following packages were imported:\n"
+            "PACKAGE   VERSION   PATH\n"
+            "numpy     {}    /np   \n".format(version)
+        )
+        store_main([db, "ingest", "--run", host, str(report)])
+    store_main([db, "query", "numpy", "--version", "1.16.0"])
+    assert capsys.readouterr().out == "node2   node2   1.16.0\n"
+    store_main([db, "diff", "node1", "node2"])
+    assert capsys.readouterr().out == "numpy   1.15.1   1.16.0\n"
+    twice = tmpdir.join("node3.log")
+    twice.write(report.read() * 2)
+    with pytest.raises(SystemExit):
+        store_main([db, "ingest", "--run", "node3", str(twice)])
+    assert "found 2" in capsys.readouterr().err
+    broken = tmpdir.join("node4.json")
+    broken.write('{"python": "3.7"}')
+    missing = str(tmpdir.join("missing.log"))
+    with pytest.raises(SystemExit):
+        store_main([db, "ingest", "--run", "node4", str(broken), missing, str(report)])
+    err = capsys.readouterr().err
+    assert "node4.json" in err and "missing.log" in err
+    store_main([db, "query", "numpy", "--run", "node4"])
+    assert capsys.readouterr().out == "node4   node2   1.16.0\n"
+
+
+def import_absolute(bpatrol, pkg):
+    return bpatrol(pkg + ".sub.mod", {}, None, None, 0)
+
+
+def import_relative(bpatrol, pkg):
+    importer = {"__package__": pkg + ".sub", "__name__": pkg + ".sub.mod"}
+    return bpatrol("sibling", importer, None, ("sibling",), 2)
+
+
+def import_fromlist(bpatrol, pkg):
+    return bpatrol(pkg + ".sub", {}, None, ("mod",), 0)
+
+
+def import_importlib(bpatrol, pkg):
+    return importlib.import_module("..sibling", pkg + ".sub")
+
+
+IMPORT_PATHS = [import_absolute, import_relative, import_fromlist, import_importlib]
+
+
+@pytest.fixture(params=IMPORT_PATHS, ids=lambda fun: fun.__name__)
+def import_path(request, bpatrol, tmpdir, monkeypatch):
+    """Return import function and name of a fresh package to import"""
+    pkg = "bp_" + request.param.__name__
+    root = tmpdir.mkdir(pkg)
+    root.join("__init__.py").write("")
+    root.join("sibling.py").write("")
+    root.mkdir("sub").join("__init__.py").write("")
+    root.join("sub", "mod.py").write("")
+    monkeypatch.syspath_prepend(str(tmpdir))
+    yield request.param, pkg
+    for name in [name for name in sys.modules if name.split(".")[0] == pkg]:
+        del sys.modules[name]
+    bpatrol.packages[:] = [p for p in bpatrol.packages if p.__name__ != pkg]
+    bpatrol.snapshots.pop(pkg, None)
+    for key in [key for key, top in bpatrol.resolved.items() if top == pkg]:
+        del bpatrol.resolved[key]
+
+
+def test_import_paths(bpatrol, import_path, monkeypatch):
+    import_fun, pkg = import_path
+    import_fun(bpatrol, pkg)
+    assert sys.modules[pkg] in bpatrol.packages
+    # packages without any distribution cannot be checked for drift
+    assert pkg in bpatrol.unresolved()
+    assert pkg not in [name for name, _, _ in bpatrol.check_drift()]
+    resolved = dict(bpatrol.resolved)
+    calls = []
+
+    def counting_import(*args):
+        calls.append(args[0])
+        return builtin_import(*args)
+
+    monkeypatch.setattr(border_patrol, "builtin_import", counting_import)
+    import_fun(bpatrol, pkg)
+    assert len(calls) == (0 if import_fun is import_importlib else 1)
+    assert bpatrol.resolved == resolved
+    assert bpatrol.packages.count(sys.modules[pkg]) == 1
+
+
+def legacy_tracker(bpatrol):
+    """Former tracking importing the top-level package a second time"""
+
+    def legacy_import(*args):
+        module = builtin_import(*args)
+        if module.__name__ not in border_patrol.BUILTINS:
+            package = builtin_import(border_patrol.get_package(module))
+            if package not in bpatrol.packages:
+                bpatrol.packages.append(package)
+        return module
+
+    return legacy_import
+
+
+@pytest.mark.system
+def test_system_benchmark_import_paths(bpatrol, import_path, record_property):
+    import_fun, pkg = import_path
+    import_fun(bpatrol, pkg)
+    bpatrol.unregister()
+    try:
+        plain = min(timeit.repeat(lambda: import_fun(builtin_import, pkg), number=1000))
+        legacy_import = legacy_tracker(bpatrol)
+        legacy = min(timeit.repeat(lambda: import_fun(legacy_import, pkg), number=1000))
+    finally:
+        bpatrol.register()
+    tracked = min(timeit.repeat(lambda: import_fun(bpatrol, pkg), number=1000))
+    # timings in microseconds per call
+    record_property("plain_us", plain * 1000)
+    record_property("legacy_us", legacy * 1000)
+    record_property("tracked_us", tracked * 1000)
+    if import_fun is not import_importlib:
+        # importlib.import_module was not tracked at all before
+        assert tracked < legacy
+
+
+@pytest.mark.system
+def test_system_benchmark_first_import(bpatrol, tmpdir, monkeypatch, record_property):
+    n_pkgs = 50
+    for prefix in ("bp_cold_plain", "bp_cold_tracked"):
+        for i in range(n_pkgs):
+            name = "{}{}".format(prefix, i)
+            tmpdir.mkdir(name).join("__init__.py").write("__version__ = '1.0'\n")
+            dist_info = tmpdir.mkdir("{}-1.0.dist-info".format(name))
+            dist_info.join("METADATA").write("Name: {}\nVersion: 1.0\n".format(name))
+            dist_info.join("top_level.txt").write(name)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    importlib.invalidate_caches()
+    bpatrol.unregister()
+    try:
+        start = timeit.default_timer()
+        for i in range(n_pkgs):
+            builtin_import("bp_cold_plain{}".format(i))
+        plain = timeit.default_timer() - start
+    finally:
+        bpatrol.register()
+    start = timeit.default_timer()
+    for i in range(n_pkgs):
+        bpatrol("bp_cold_tracked{}".format(i), {}, None, None, 0)
+    tracked = timeit.default_timer() - start
+    try:
+        # timings in microseconds per first import including snapshot
+        record_property("plain_us", plain / n_pkgs * 1e6)
+        record_property("tracked_us", tracked / n_pkgs * 1e6)
+        assert all(
+            bpatrol.snapshots["bp_cold_tracked{}".format(i)][1] != UNKNOWN
+            for i in range(n_pkgs)
+        )
+        assert tracked < 3 * plain
+    finally:
+        for name in [name for name in sys.modules if name.startswith("bp_cold_")]:
+            package = sys.modules.pop(name)
+            if package in bpatrol.packages:
+                bpatrol.packages.remove(package)
+                del bpatrol.snapshots[name]